@@ -1,14 +1,24 @@
 import os
 import subprocess
 import logging
-import json
+import atexit
+import functools
+import shutil
+import ipaddress
+import orjson
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, Callable, List, Tuple
 from dataclasses import dataclass
-from flask import Flask, request, jsonify
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+import httpx
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.middleware.proxy_fix import ProxyFix
+from prompts import SYSTEM_PREFIX
 import threading
 import queue
 import signal
@@ -21,17 +31,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for request parsing and jsonify()."""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+app.config["MAX_CONTENT_LENGTH"] = 64 * 1024
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
-# Rate limiting
+# Rate limiting. Counters live in Redis (REDIS_URL) so every gunicorn worker
+# shares them; without it each worker would enforce its own separate limits.
+redis_url = os.environ.get("REDIS_URL")
+if not redis_url:
+    logger.warning("⚠️ REDIS_URL is not set; rate limits are tracked per worker process")
+
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["100 per hour", "20 per minute"]
+    default_limits=["100 per hour", "20 per minute"],
+    storage_uri=redis_url or "memory://",
+    strategy="moving-window",
+    in_memory_fallback_enabled=bool(redis_url)
 )
 
+@limiter.request_filter
+def is_internal_request() -> bool:
+    """Exempt loopback callers such as the bundled Telegram bot from rate limits.
+    
+    The bot calls /generate from 127.0.0.1 on behalf of every chat, so keying
+    it on its address would make all Telegram users share one bucket. External
+    clients arrive through the proxy and keep their forwarded address.
+    """
+    try:
+        return ipaddress.ip_address(request.remote_addr or "").is_loopback
+    except ValueError:
+        return False
+
 @dataclass
 class GenerationRequest:
     prompt: str
@@ -46,18 +88,124 @@ class GenerationResponse:
     text: str
     tokens_generated: int = 0
     generation_time: float = 0.0
+    tokens_per_second: float = 0.0
     error: Optional[str] = None
 
+class BatchScheduler:
+    """Dispatches concurrent generation requests to llama-server's parallel slots.
+    
+    Each request is posted as its own /completion call from a bounded thread
+    pool; llama-server's continuous batching merges the in-flight sequences,
+    so a short answer resolves as soon as it finishes instead of waiting for
+    the rest of a batch.
+    """
+    
+    def __init__(self, handler: Callable[[GenerationRequest], GenerationResponse],
+                 max_batch: int = 16):
+        self.handler = handler
+        self.max_batch = max(1, max_batch)
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._owner_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+    
+    def _ensure_started(self) -> None:
+        """Create the thread pool in the current process.
+        
+        Threads do not survive gunicorn forking workers after ``--preload``, so
+        each worker creates its own pool on first use.
+        """
+        if self._owner_pid == os.getpid():
+            return
+        
+        with self._start_lock:
+            if self._owner_pid == os.getpid():
+                return
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_batch,
+                thread_name_prefix="llama-batch"
+            )
+            self._owner_pid = os.getpid()
+    
+    def submit(self, gen_request: GenerationRequest) -> Future:
+        """Post a request and return a future resolved with its own response."""
+        self._ensure_started()
+        return self.executor.submit(self.handler, gen_request)
+
 class LlamaModelManager:
     """Manages LLaMA model execution and configuration."""
     
     def __init__(self):
         self.llama_path: Optional[str] = None
+        self.server_path: Optional[str] = None
         self.model_path: Optional[str] = None
+        self.model_size_bytes = 0
         self.is_initialized = False
-        self.model_lock = threading.Lock()
+        self.server_ready = False
+        self.server_process: Optional[subprocess.Popen] = None
+        self._server_owner_pid: Optional[int] = None
+        
+        # llama-server endpoint (kept on localhost, weights stay resident between requests)
+        self.server_host = os.environ.get("LLAMA_SERVER_HOST", "127.0.0.1")
+        self.server_port = int(os.environ.get("LLAMA_SERVER_PORT", 8081))
+        self.server_url = f"http://{self.server_host}:{self.server_port}"
+        
+        # Seconds between health probes while llama-server is down, and between
+        # liveness checks of the process this instance started
+        self.server_retry_interval = float(os.environ.get("LLAMA_SERVER_RETRY_INTERVAL", 10))
+        self._last_server_probe = 0.0
+        self._watchdog_stop = threading.Event()
+        self._watchdog_started = False
+        
+        # Parallel decode slots; llama-server splits -c evenly between them, so the
+        # total context is sized from the per-slot window
+        self.n_parallel = max(1, int(os.environ.get("LLAMA_PARALLEL", 8)))
+        self.slot_ctx = int(os.environ.get("LLAMA_SLOT_CTX", 4096))
+        self.ctx_size = self.n_parallel * self.slot_ctx
+        self.max_tokens_limit = min(4096, self.slot_ctx)
+        
+        # GPU offload (ignored by CPU-only builds) and quantized KV cache
+        self.n_gpu_layers = int(os.environ.get("LLAMA_N_GPU_LAYERS", 999))
+        self.cache_type = os.environ.get("LLAMA_CACHE_TYPE", "q8_0")
+        self.flash_attn = os.environ.get("LLAMA_FLASH_ATTN", "on")
+        
+        # Lock model weights in RAM so they are never paged out between requests
+        self.mlock = os.environ.get("LLAMA_MLOCK", "true").lower() == "true"
+        
+        # Prefix shared by client prompts (the Telegram bot's system block by default);
+        # llama-cli reuses its prefilled KV state from a read-only prompt cache file
+        self.prompt_cache_prefix = os.environ.get("LLAMA_PROMPT_CACHE_PREFIX", SYSTEM_PREFIX)
+        self.prompt_cache_path = os.environ.get("LLAMA_PROMPT_CACHE", "/tmp/llama-prompt.cache")
+        self.prompt_cache_ready = False
+        
+        # llama-cli fallback: bounded concurrency, each slot pinned to one NUMA node
+        self.numactl_path = shutil.which("numactl")
+        self.numa_nodes = self._count_numa_nodes()
+        self.cli_parallel = max(1, int(os.environ.get("LLAMA_CLI_PARALLEL", self.numa_nodes)))
+        self.cli_slots: "queue.Queue[int]" = queue.Queue()
+        for slot in range(self.cli_parallel):
+            self.cli_slots.put(slot % self.numa_nodes)
+        # Concurrent requests are posted individually; llama-server batches them across its slots
+        self.scheduler = BatchScheduler(
+            self._generate_server,
+            max_batch=int(os.environ.get("LLAMA_BATCH_SIZE", 16))
+        )
+        self.http = httpx.Client(
+            base_url=self.server_url,
+            timeout=httpx.Timeout(180.0, connect=5.0)
+        )
+        
+        # Memoized llama-cli argument lists; bot traffic mostly uses default parameters
+        self._cli_command = functools.lru_cache(maxsize=256)(self._build_cli_command)
         
         # Possible paths for executable and model
+        self.possible_server_paths = [
+            "/app/llama.cpp/build/bin/llama-server",
+            "/app/llama.cpp/build/bin/server",
+            "/app/llama.cpp/llama-server",
+            "./llama.cpp/build/bin/llama-server",
+            "./llama-server"
+        ]
+        
         self.possible_llama_paths = [
             "/app/llama.cpp/build/bin/llama-cli",
             "/app/llama.cpp/build/bin/main",
@@ -67,7 +215,11 @@ class LlamaModelManager:
             "./llama-cli"
         ]
         
+        # Bandwidth-friendly quantizations first: decode streams every weight per token
         self.possible_model_paths = [
+            "/app/models/model.Q4_K_4.gguf",
+            "/app/models/model.Q8R16.gguf",
+            "/app/models/model.Q4_0.gguf",
             "/app/models/model.gguf",
             "/app/models/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf",
             "./models/model.gguf",
@@ -77,12 +229,65 @@ class LlamaModelManager:
         # Initialize paths
         self._find_paths()
     
+    @staticmethod
+    def _count_numa_nodes() -> int:
+        """Count NUMA nodes exposed by the kernel (1 when unknown)."""
+        try:
+            with os.scandir("/sys/devices/system/node") as entries:
+                nodes = sum(1 for entry in entries if entry.name.startswith("node") and entry.name[4:].isdigit())
+        except OSError:
+            return 1
+        return max(1, nodes)
+    
+    @contextmanager
+    def _cli_slot(self) -> Iterator[List[str]]:
+        """Reserve a llama-cli slot and yield the numactl prefix pinning it to its node."""
+        node = self.cli_slots.get()
+        try:
+            if self.numactl_path and self.numa_nodes > 1:
+                yield [self.numactl_path, f"--cpunodebind={node}", f"--membind={node}"]
+            else:
+                yield []
+        finally:
+            self.cli_slots.put(node)
+    
+    @staticmethod
+    def _lookup(path: str, listings: Dict[str, Dict[str, os.DirEntry]]) -> Optional[os.DirEntry]:
+        """Resolve a candidate path against a single scandir() listing of its directory."""
+        if not path:
+            return None
+        
+        directory = os.path.dirname(path) or "."
+        if directory not in listings:
+            try:
+                with os.scandir(directory) as entries:
+                    listings[directory] = {entry.name: entry for entry in entries}
+            except OSError:
+                listings[directory] = {}
+        
+        return listings[directory].get(os.path.basename(path))
+    
     def _find_paths(self) -> None:
         """Find executable and model paths."""
+        # Each candidate directory is listed once and shared by all lookups
+        listings: Dict[str, Dict[str, os.DirEntry]] = {}
+        
+        logger.info("🔍 Searching for llama-server executable...")
+        
+        for path in self.possible_server_paths:
+            entry = self._lookup(path, listings)
+            if entry is not None and entry.is_file() and os.access(entry.path, os.X_OK):
+                self.server_path = path
+                logger.info(f"✅ llama-server executable found: {path}")
+                break
+        else:
+            logger.warning("⚠️ llama-server executable not found, falling back to llama-cli")
+        
         logger.info("🔍 Searching for LLaMA executable...")
         
         for path in self.possible_llama_paths:
-            if path and os.path.exists(path) and os.access(path, os.X_OK):
+            entry = self._lookup(path, listings)
+            if entry is not None and entry.is_file() and os.access(entry.path, os.X_OK):
                 self.llama_path = path
                 logger.info(f"✅ LLaMA executable found: {path}")
                 break
@@ -92,14 +297,18 @@ class LlamaModelManager:
         logger.info("🔍 Searching for model file...")
         
         for path in self.possible_model_paths:
-            if path and os.path.exists(path) and os.path.getsize(path) > 1024 * 1024:
+            entry = self._lookup(path, listings)
+            if entry is not None and entry.is_file() and entry.stat().st_size > 1024 * 1024:
                 self.model_path = path
-                logger.info(f"✅ Model found: {path} ({self._format_size(os.path.getsize(path))})")
+                self.model_size_bytes = entry.stat().st_size
+                logger.info(f"✅ Model found: {path} ({self._format_size(self.model_size_bytes)})")
+                self._prefetch_model()
                 break
         else:
             logger.error("❌ Model file not found")
         
-        self.is_initialized = self.llama_path is not None and self.model_path is not None
+        has_executable = self.server_path is not None or self.llama_path is not None
+        self.is_initialized = has_executable and self.model_path is not None
         
         if self.is_initialized:
             logger.info("🎉 LLaMA model manager initialized successfully")
@@ -115,6 +324,218 @@ class LlamaModelManager:
             size_bytes /= 1024.0
         return f"{size_bytes:.1f} TB"
     
+    def _prefetch_model(self) -> None:
+        """Start reading the model into the page cache before llama.cpp maps it."""
+        if not hasattr(os, "posix_fadvise"):
+            return
+        
+        try:
+            fd = os.open(self.model_path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, self.model_size_bytes, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not prefetch model file: {e}")
+    
+    def _server_healthy(self) -> bool:
+        """Check whether llama-server has finished loading the model."""
+        try:
+            return httpx.get(f"{self.server_url}/health", timeout=2.0).status_code == 200
+        except httpx.HTTPError:
+            return False
+    
+    def check_server(self) -> bool:
+        """Report whether llama-server is usable, re-probing it after a backoff while down.
+        
+        A healthy server is not probed again; a failed request marks it down
+        through ``_mark_server_down``. While it is down, at most one probe per
+        ``server_retry_interval`` is made, so a restarted server is picked up
+        again without putting an HTTP round trip on every call.
+        """
+        if self.server_ready:
+            return True
+        if self.server_path is None:
+            return False
+        
+        now = time.time()
+        if now - self._last_server_probe < self.server_retry_interval:
+            return False
+        self._last_server_probe = now
+        
+        self.server_ready = self._server_healthy()
+        if self.server_ready:
+            logger.info(f"✅ llama-server is reachable again at {self.server_url}")
+        return self.server_ready
+    
+    def _mark_server_down(self, error: Exception) -> None:
+        """Stop routing to llama-server after a failed connection until a later probe succeeds."""
+        logger.error(f"❌ llama-server is unreachable, falling back to llama-cli: {error}")
+        self.server_ready = False
+        self._last_server_probe = time.time()
+    
+    def start_server(self, timeout: float = 300.0) -> bool:
+        """Start a persistent llama-server and wait until it reports healthy."""
+        if not self.is_initialized or not self.server_path:
+            return False
+        
+        if self._server_healthy():
+            logger.info(f"✅ llama-server already running at {self.server_url}")
+            self.server_ready = True
+            return True
+        
+        command = [
+            self.server_path,
+            "-m", self.model_path,
+            "--host", self.server_host,
+            "--port", str(self.server_port),
+            "-c", str(self.ctx_size),
+            "-np", str(self.n_parallel),
+            "--cont-batching",
+            "-ngl", str(self.n_gpu_layers),
+            "--flash-attn", self.flash_attn,
+            "--cache-type-k", self.cache_type
+        ]
+        
+        # llama.cpp refuses a quantized V cache without flash attention
+        if self.flash_attn != "off":
+            command += ["--cache-type-v", self.cache_type]
+        else:
+            logger.warning("⚠️ Flash attention is off, keeping the V cache unquantized")
+        
+        if self.mlock:
+            command.append("--mlock")
+        
+        logger.info(f"🚀 Starting llama-server on {self.server_url}...")
+        self.server_process = subprocess.Popen(command)
+        self._server_owner_pid = os.getpid()
+        
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.server_process.poll() is not None:
+                logger.error(f"❌ llama-server exited with code {self.server_process.returncode}")
+                self.server_process = None
+                return False
+            if self._server_healthy():
+                logger.info("✅ llama-server is ready")
+                self.server_ready = True
+                self._start_watchdog()
+                return True
+            time.sleep(0.5)
+        
+        logger.error("⏱️ llama-server did not become healthy in time")
+        self._terminate_server()
+        return False
+    
+    def _start_watchdog(self) -> None:
+        """Start a thread that respawns llama-server if the process it owns exits.
+        
+        Runs in the process that launched the server (the gunicorn master under
+        ``--preload``); forked workers only see the result through ``check_server``.
+        """
+        if self._watchdog_started:
+            return
+        self._watchdog_started = True
+        threading.Thread(target=self._watch_server, name="llama-server-watchdog", daemon=True).start()
+    
+    def _watch_server(self) -> None:
+        while not self._watchdog_stop.wait(self.server_retry_interval):
+            if self._server_owner_pid != os.getpid():
+                return
+            
+            process = self.server_process
+            if process is not None and process.poll() is None:
+                continue
+            
+            if process is not None:
+                logger.error(f"❌ llama-server exited with code {process.returncode}, restarting...")
+                self.server_process = None
+            self.server_ready = False
+            self.start_server()
+    
+    def stop_server(self) -> None:
+        """Terminate the llama-server process started by this process and stop respawning it."""
+        if self._server_owner_pid != os.getpid():
+            return
+        
+        self._watchdog_stop.set()
+        self._terminate_server()
+    
+    def _terminate_server(self) -> None:
+        """Terminate the owned llama-server process, leaving the watchdog running."""
+        if self.server_process is None or self._server_owner_pid != os.getpid():
+            return
+        
+        if self.server_process.poll() is None:
+            logger.info("🔄 Stopping llama-server...")
+            self.server_process.terminate()
+            try:
+                self.server_process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.server_process.kill()
+        
+        self.server_process = None
+        self.server_ready = False
+    
+    def warm_prompt_cache(self) -> bool:
+        """Prefill the shared prompt prefix once and save it for llama-cli to reuse.
+        
+        Only used by the llama-cli fallback; llama-server keeps the prefix in
+        its slots through ``cache_prompt``.
+        """
+        if not self.prompt_cache_prefix or self.llama_path is None or self.model_path is None:
+            return False
+        
+        command = [
+            self.llama_path,
+            "-m", self.model_path,
+            "-p", self.prompt_cache_prefix,
+            "-n", "1",
+            "-ngl", str(self.n_gpu_layers),
+            "--flash-attn", self.flash_attn,
+            "--prompt-cache", self.prompt_cache_path,
+            "--no-display-prompt",
+            "--log-disable",
+            "--simple-io"
+        ]
+        
+        logger.info(f"🔥 Building prompt cache at {self.prompt_cache_path}...")
+        
+        try:
+            process = subprocess.run(command, capture_output=True, timeout=180, check=False)
+        except subprocess.TimeoutExpired:
+            logger.error("⏱️ Prompt cache warm-up timed out")
+            return False
+        
+        if process.returncode != 0 or not os.path.exists(self.prompt_cache_path):
+            logger.error(f"⚠️ Prompt cache warm-up failed with code {process.returncode}")
+            return False
+        
+        self.prompt_cache_ready = True
+        logger.info("✅ Prompt cache ready")
+        return True
+    
+    def _validate_parameters(self, request: GenerationRequest) -> None:
+        """Clamp sampling parameters to supported ranges."""
+        request.max_tokens = max(1, min(request.max_tokens, self.max_tokens_limit))
+        request.temperature = max(0.1, min(request.temperature, 2.0))
+        request.top_p = max(0.1, min(request.top_p, 1.0))
+        request.repeat_penalty = max(0.1, min(request.repeat_penalty, 2.0))
+    
+    @staticmethod
+    def _completion_payload(request: GenerationRequest, stream: bool = False) -> Dict[str, Any]:
+        """Build the llama-server /completion request body."""
+        return {
+            "prompt": request.prompt,
+            "n_predict": request.max_tokens,
+            "temperature": request.temperature,
+            "top_p": request.top_p,
+            "repeat_penalty": request.repeat_penalty,
+            "stream": stream,
+            # Reuse the KV cache of a shared prompt prefix (e.g. a fixed system prompt)
+            "cache_prompt": True
+        }
+    
     def generate(self, request: GenerationRequest) -> GenerationResponse:
         """Generate text using LLaMA model."""
         if not self.is_initialized:
@@ -124,37 +545,209 @@ class LlamaModelManager:
                 error="Model not initialized. Check if LLaMA executable and model file exist."
             )
         
-        start_time = time.time()
+        self._validate_parameters(request)
+        
+        logger.info(f"🚀 Generating response for prompt: {request.prompt[:100]}...")
         
-        with self.model_lock:
+        if self.check_server():
             try:
-                # Validate parameters
-                request.max_tokens = max(1, min(request.max_tokens, 4096))
-                request.temperature = max(0.1, min(request.temperature, 2.0))
-                request.top_p = max(0.1, min(request.top_p, 1.0))
-                request.repeat_penalty = max(0.1, min(request.repeat_penalty, 2.0))
-                
-                # Build command
-                command = [
-                    self.llama_path,
-                    "-m", self.model_path,
-                    "-p", request.prompt,
-                    "-n", str(request.max_tokens),
-                    "--temp", str(request.temperature),
-                    "--top-p", str(request.top_p),
-                    "--repeat-penalty", str(request.repeat_penalty),
-                    "--no-display-prompt",
-                    "--log-disable",
-                    "--simple-io"
-                ]
+                return self.scheduler.submit(request).result()
+            except httpx.ConnectError as e:
+                self._mark_server_down(e)
+        
+        if self.llama_path is None:
+            return GenerationResponse(
+                success=False,
+                text="",
+                error="llama-server is not running and no llama-cli fallback is available"
+            )
+        
+        return self._generate_cli(request)
+    
+    def _generate_server(self, request: GenerationRequest) -> GenerationResponse:
+        """Generate text through the persistent llama-server HTTP API."""
+        start_time = time.time()
+        
+        try:
+            response = self.http.post("/completion", json=self._completion_payload(request))
+            generation_time = time.time() - start_time
+            
+            if response.status_code != 200:
+                logger.error(f"⚠️ llama-server returned status {response.status_code}: {response.text[:500]}")
+                return GenerationResponse(
+                    success=False,
+                    text="",
+                    generation_time=generation_time,
+                    error=f"Model server failed with status {response.status_code}"
+                )
+            
+            return self._server_response(orjson.loads(response.content), generation_time)
+            
+        except httpx.ConnectError:
+            # Let generate() switch to the llama-cli fallback
+            raise
+        except httpx.TimeoutException:
+            generation_time = time.time() - start_time
+            logger.error("⏱️ Generation timeout exceeded")
+            return GenerationResponse(
+                success=False,
+                text="",
+                generation_time=generation_time,
+                error="Generation timeout exceeded (3 minutes)"
+            )
+        except Exception as e:
+            generation_time = time.time() - start_time
+            logger.error(f"❌ Unexpected error in generation: {e}")
+            return GenerationResponse(
+                success=False,
+                text="",
+                generation_time=generation_time,
+                error=f"Unexpected error: {str(e)}"
+            )
+    
+    @staticmethod
+    def _server_response(result: Dict[str, Any], generation_time: float) -> GenerationResponse:
+        """Convert one llama-server completion result into a GenerationResponse."""
+        output = result.get("content", "").strip()
+        
+        if not output:
+            return GenerationResponse(
+                success=False,
+                text="",
+                generation_time=generation_time,
+                error="Model generated empty response"
+            )
+        
+        # Exact counts reported by llama-server
+        tokens_generated = result.get("tokens_predicted", 0)
+        tokens_per_second = result.get("timings", {}).get("predicted_per_second", 0.0)
+        
+        logger.info(f"✅ Generated {tokens_generated} tokens in {generation_time:.2f}s ({tokens_per_second:.1f} t/s)")
+        
+        return GenerationResponse(
+            success=True,
+            text=output,
+            tokens_generated=tokens_generated,
+            generation_time=generation_time,
+            tokens_per_second=tokens_per_second
+        )
+    
+    def generate_stream(self, request: GenerationRequest) -> Iterator[Dict[str, Any]]:
+        """Generate text incrementally, yielding content chunks as they are decoded.
+        
+        Yields ``{"content": ...}`` events followed by a final event with
+        ``stop`` set, or a single ``{"error": ...}`` event on failure.
+        """
+        if not self.check_server():
+            yield from self._stream_full_response(request)
+            return
+        
+        self._validate_parameters(request)
+        logger.info(f"🚀 Streaming response for prompt: {request.prompt[:100]}...")
+        
+        start_time = time.time()
+        tokens_generated = 0
+        tokens_per_second = 0.0
+        
+        try:
+            payload = self._completion_payload(request, stream=True)
+            with self.http.stream("POST", "/completion", json=payload) as response:
+                if response.status_code != 200:
+                    logger.error(f"⚠️ llama-server returned status {response.status_code}")
+                    yield {"error": f"Model server failed with status {response.status_code}"}
+                    return
                 
-                logger.info(f"🚀 Generating response for prompt: {request.prompt[:100]}...")
+                for line in response.iter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    
+                    chunk = orjson.loads(line[len("data: "):])
+                    if chunk.get("content"):
+                        yield {"content": chunk["content"]}
+                    if chunk.get("stop"):
+                        # The final chunk carries the server's exact counts
+                        tokens_generated = chunk.get("tokens_predicted", 0)
+                        tokens_per_second = chunk.get("timings", {}).get("predicted_per_second", 0.0)
+                        break
+            
+            generation_time = time.time() - start_time
+            logger.info(f"✅ Streamed {tokens_generated} tokens in {generation_time:.2f}s ({tokens_per_second:.1f} t/s)")
+            yield {
+                "stop": True,
+                "tokens_generated": tokens_generated,
+                "generation_time": round(generation_time, 3),
+                "tokens_per_second": round(tokens_per_second, 2)
+            }
+            
+        except httpx.ConnectError as e:
+            # Raised before any chunk is sent, so the fallback can answer in full
+            self._mark_server_down(e)
+            yield from self._stream_full_response(request)
+        except httpx.TimeoutException:
+            logger.error("⏱️ Generation timeout exceeded")
+            yield {"error": "Generation timeout exceeded (3 minutes)"}
+        except Exception as e:
+            logger.error(f"❌ Unexpected error in streaming generation: {e}")
+            yield {"error": f"Unexpected error: {str(e)}"}
+    
+    def _stream_full_response(self, request: GenerationRequest) -> Iterator[Dict[str, Any]]:
+        """Emit a non-streamed generation (llama-cli has no incremental output) as one chunk."""
+        response = self.generate(request)
+        if not response.success:
+            yield {"error": response.error}
+            return
+        yield {"content": response.text}
+        yield {
+            "stop": True,
+            "tokens_generated": response.tokens_generated,
+            "generation_time": round(response.generation_time, 3),
+            "tokens_per_second": round(response.tokens_per_second, 2)
+        }
+    
+    def _build_cli_command(self, max_tokens: int, temperature: float, top_p: float,
+                           repeat_penalty: float) -> Tuple[str, ...]:
+        """Build the llama-cli arguments for a parameter set, without the prompt."""
+        command = [
+            self.llama_path,
+            "-m", self.model_path,
+            "-n", str(max_tokens),
+            "--temp", str(temperature),
+            "--top-p", str(top_p),
+            "--repeat-penalty", str(repeat_penalty),
+            "-ngl", str(self.n_gpu_layers),
+            "--flash-attn", self.flash_attn,
+            "--no-display-prompt",
+            "--log-disable",
+            "--simple-io"
+        ]
+        
+        if self.prompt_cache_ready:
+            command += ["--prompt-cache", self.prompt_cache_path, "--prompt-cache-ro"]
+        
+        if self.mlock:
+            command.append("--mlock")
+        
+        return tuple(command)
+    
+    def _generate_cli(self, request: GenerationRequest) -> GenerationResponse:
+        """Generate text by spawning llama-cli (fallback when llama-server is unavailable)."""
+        start_time = time.time()
+        
+        with self._cli_slot() as numa_prefix:
+            try:
+                # Build command (sampling arguments are cached per parameter set)
+                command = numa_prefix + list(self._cli_command(
+                    request.max_tokens,
+                    request.temperature,
+                    request.top_p,
+                    request.repeat_penalty
+                )) + ["-p", request.prompt]
                 
                 # Execute model
+                # Capture raw bytes; stdout is decoded exactly once below
                 process = subprocess.run(
                     command,
                     capture_output=True,
-                    text=True,
                     timeout=180,  # 3 minutes timeout
                     check=False
                 )
@@ -163,7 +756,7 @@ class LlamaModelManager:
                 
                 if process.returncode != 0:
                     logger.error(f"⚠️ Process returned non-zero exit code: {process.returncode}")
-                    logger.error(f"STDERR: {process.stderr}")
+                    logger.error(f"STDERR: {process.stderr.decode('utf-8', 'replace')}")
                     return GenerationResponse(
                         success=False,
                         text="",
@@ -171,11 +764,12 @@ class LlamaModelManager:
                         error=f"Model execution failed with code {process.returncode}"
                     )
                 
-                output = process.stdout.strip()
+                output = process.stdout.decode("utf-8", "replace").strip()
                 
-                # Clean output
-                if request.prompt in output:
-                    output = output.replace(request.prompt, "", 1).strip()
+                # Clean output: --no-display-prompt normally suppresses the echo, and
+                # builds that ignore it print the prompt as a prefix
+                if output.startswith(request.prompt):
+                    output = output[len(request.prompt):].lstrip()
                 
                 if not output:
                     return GenerationResponse(
@@ -218,12 +812,22 @@ class LlamaModelManager:
 
 # Global model manager
 model_manager = LlamaModelManager()
+if not model_manager.start_server():
+    model_manager.warm_prompt_cache()
+atexit.register(model_manager.stop_server)
 
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Endpoint not found"}), 404
 
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({
+        "error": "Request too large",
+        "message": f"Request body must not exceed {app.config['MAX_CONTENT_LENGTH'] // 1024} KB."
+    }), 413
+
 @app.errorhandler(429)
 def rate_limit_exceeded(error):
     return jsonify({
@@ -244,8 +848,8 @@ def home():
         "version": "1.0.0",
         "status": "online" if model_manager.is_initialized else "model_not_ready",
         "features": {
-            "rate_limiting": "enabled" if (limiter or 'simple_limiter' in locals()) else "disabled",
-            "rate_limiter_type": "flask-limiter" if limiter else "simple" if 'simple_limiter' in locals() else "none"
+            "rate_limiting": "enabled" if limiter else "disabled",
+            "rate_limiter_type": "flask-limiter" if limiter else "none"
         },
         "endpoints": {
             "/": "API information",
@@ -262,10 +866,11 @@ def home():
                 "method": "POST",
                 "required_fields": ["prompt"],
                 "optional_fields": {
-                    "max_tokens": "integer (1-4096, default: 512)",
+                    "max_tokens": f"integer (1-{model_manager.max_tokens_limit}, default: 512)",
                     "temperature": "float (0.1-2.0, default: 0.8)",
                     "top_p": "float (0.1-1.0, default: 0.9)",
-                    "repeat_penalty": "float (0.1-2.0, default: 1.1)"
+                    "repeat_penalty": "float (0.1-2.0, default: 1.1)",
+                    "stream": "boolean (default: false), stream chunks as server-sent events"
                 }
             }
         }
@@ -274,13 +879,15 @@ def home():
 @app.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint."""
-    healthy = model_manager.is_initialized
+    server_up = model_manager.check_server()
+    healthy = model_manager.is_initialized and (server_up or model_manager.llama_path is not None)
     
     health_data = {
         "status": "healthy" if healthy else "unhealthy",
         "timestamp": time.time(),
         "checks": {
             "llama_executable": model_manager.llama_path is not None,
+            "llama_server": server_up,
             "model_file": model_manager.model_path is not None,
             "initialization": model_manager.is_initialized
         }
@@ -289,12 +896,12 @@ def health_check():
     if model_manager.llama_path:
         health_data["llama_path"] = model_manager.llama_path
     
+    if model_manager.server_path:
+        health_data["server_path"] = model_manager.server_path
+    
     if model_manager.model_path:
         health_data["model_path"] = model_manager.model_path
-        try:
-            health_data["model_size"] = model_manager._format_size(os.path.getsize(model_manager.model_path))
-        except:
-            pass
+        health_data["model_size"] = model_manager._format_size(model_manager.model_size_bytes)
     
     return jsonify(health_data), 200 if healthy else 503
 
@@ -307,9 +914,11 @@ def model_info():
     info = {
         "model_path": model_manager.model_path,
         "executable_path": model_manager.llama_path,
-        "model_size": model_manager._format_size(os.path.getsize(model_manager.model_path)),
+        "server_path": model_manager.server_path,
+        "backend": "llama-server" if model_manager.server_ready else "llama-cli",
+        "model_size": model_manager._format_size(model_manager.model_size_bytes),
         "supported_parameters": {
-            "max_tokens": "1-4096",
+            "max_tokens": f"1-{model_manager.max_tokens_limit}",
             "temperature": "0.1-2.0",
             "top_p": "0.1-1.0",
             "repeat_penalty": "0.1-2.0"
@@ -329,9 +938,16 @@ def generate_text():
         }), 503
     
     try:
-        data = request.get_json()
+        # Parse the raw body once; MAX_CONTENT_LENGTH rejects oversized payloads before decoding
+        try:
+            data = orjson.loads(request.get_data(cache=False))
+        except orjson.JSONDecodeError:
+            return jsonify({
+                "success": False,
+                "error": "Request body must be valid JSON"
+            }), 400
         
-        if not data or "prompt" not in data:
+        if not isinstance(data, dict) or "prompt" not in data:
             return jsonify({
                 "success": False,
                 "error": "Missing required field: prompt"
@@ -339,19 +955,28 @@ def generate_text():
         
         # Create generation request
         gen_request = GenerationRequest(
-            prompt=str(data["prompt"]).strip(),
+            # Passed through unchanged: chat templates end in significant whitespace
+            prompt=str(data["prompt"]),
             max_tokens=int(data.get("max_tokens", 512)),
             temperature=float(data.get("temperature", 0.8)),
             top_p=float(data.get("top_p", 0.9)),
             repeat_penalty=float(data.get("repeat_penalty", 1.1))
         )
         
-        if not gen_request.prompt:
+        if not gen_request.prompt.strip():
             return jsonify({
                 "success": False,
                 "error": "Prompt cannot be empty"
             }), 400
         
+        if data.get("stream"):
+            # Server-sent events: one "data:" line per chunk, ending with a stop/error event
+            def event_stream():
+                for event in model_manager.generate_stream(gen_request):
+                    yield b"data: " + orjson.dumps(event) + b"\n\n"
+            
+            return Response(stream_with_context(event_stream()), mimetype="text/event-stream")
+        
         # Generate response
         response = model_manager.generate(gen_request)
         
@@ -362,6 +987,7 @@ def generate_text():
             "metadata": {
                 "tokens_generated": response.tokens_generated,
                 "generation_time": round(response.generation_time, 3),
+                "tokens_per_second": round(response.tokens_per_second, 2),
                 "parameters_used": {
                     "max_tokens": gen_request.max_tokens,
                     "temperature": gen_request.temperature,
@@ -373,11 +999,13 @@ def generate_text():
         
         if not response.success:
             result["error"] = response.error
-            return jsonify(result), 500
+            return Response(orjson.dumps(result), status=500, mimetype="application/json")
         
-        return jsonify(result)
+        return Response(orjson.dumps(result), mimetype="application/json")
         
-    except ValueError as e:
+    except RequestEntityTooLarge:
+        raise
+    except (TypeError, ValueError) as e:
         return jsonify({
             "success": False,
             "error": f"Invalid parameter value: {str(e)}"
@@ -0,0 +1,18 @@
+import os
+
+# Prompt sistem tetap di awal setiap prompt agar llama-server dapat memakai ulang
+# KV cache untuk awalan yang sama di semua pengguna (cache_prompt), dan agar
+# fallback llama-cli dapat memuat awalan yang sama dari file prompt cache.
+SYSTEM_PROMPT = os.environ.get(
+    "LLAMA_SYSTEM_PROMPT",
+    "Anda adalah asisten AI yang ramah dan membantu. "
+    "Jawablah dengan jelas dan ringkas dalam bahasa yang digunakan pengguna.",
+)
+
+# Awalan bersama dalam format chat TinyLlama (Zephyr)
+SYSTEM_PREFIX = f"<|system|>\n{SYSTEM_PROMPT}</s>\n"
+
+
+# Fungsi untuk menyusun prompt lengkap dari pesan pengguna
+def build_prompt(user_prompt):
+    return f"{SYSTEM_PREFIX}<|user|>\n{user_prompt}</s>\n<|assistant|>\n"
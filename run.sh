@@ -6,11 +6,20 @@ set -e
 
 echo "Starting both LLaMA API and Telegram Bot services..."
 
-# Mulai server API LLaMA dengan Gunicorn di port 7860
-gunicorn -w 4 --bind 0.0.0.0:7860 app:app &
+# Batas laju dibagi antar worker Gunicorn melalui Redis. Tanpa REDIS_URL
+# (mis. redis://localhost:6379/0) setiap worker menghitung batasnya sendiri,
+# sehingga batas efektif menjadi kelipatan jumlah worker.
+if [[ -z "${REDIS_URL:-}" ]]; then
+    echo "WARNING: REDIS_URL tidak diset; batas laju dihitung per worker."
+fi
 
-# Mulai server bot Telegram dengan Gunicorn di port 8080 (port utama yang terekspos)
-gunicorn -w 4 --bind 0.0.0.0:8080 telegram_bot:app &
+# Mulai server API LLaMA dengan Gunicorn di port 7860.
+# --preload memuat app.py sekali di proses master sehingga llama-server hanya dijalankan satu kali.
+# Worker gthread meneruskan permintaan secara bersamaan ke slot paralel llama-server.
+gunicorn -k gthread -w 2 --threads 32 --timeout 200 --preload --bind 0.0.0.0:7860 app:app &
+
+# Mulai server bot Telegram (ASGI) dengan Uvicorn di port 8080 (port utama yang terekspos)
+uvicorn telegram_bot:app --host 0.0.0.0 --port 8080 &
 
 # Tunggu hingga salah satu proses di latar belakang berhenti
 wait -n
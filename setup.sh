@@ -42,7 +42,7 @@ download_model() {
     
     mkdir -p "/app/models"
     
-    local model_url="https://huggingface.co/TheBloke/TinyLlama-1.1B-Chat-v1.0-GGUF/resolve/main/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf"
+    local model_url="https://huggingface.co/TheBloke/TinyLlama-1.1B-Chat-v1.0-GGUF/resolve/main/tinyllama-1.1b-chat-v1.0.Q4_0.gguf"
     local model_path="/app/models/model.gguf"
     
     if command -v wget >/dev/null 2>&1; then
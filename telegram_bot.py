@@ -1,8 +1,13 @@
 import os
+import orjson
+import asyncio
+import time
 import logging
 import httpx
-from flask import Flask, request, jsonify
+from quart import Quart, request, jsonify
 from telegram import Update
+from telegram.error import RetryAfter, TelegramError
+from prompts import build_prompt
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -24,17 +29,34 @@ LLAMA_API_URL = "http://127.0.0.1:7860/generate"
 # Token Bot Telegram dari variabel lingkungan
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 
+# Frekuensi pembaruan pesan saat respons di-stream (editMessageText)
+STREAM_EDIT_EVERY_CHUNKS = 20
+STREAM_EDIT_INTERVAL = 1.0
+
 # URL yang digunakan untuk webhook.
 WEBHOOK_URL_PATH = "/telegram"
 
-# Inisialisasi aplikasi Flask
-app = Flask(__name__)
-
-# Inisialisasi Application builder untuk python-telegram-bot
-application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+# Inisialisasi aplikasi Quart (Flask async) agar semua handler berbagi satu event loop
+app = Quart(__name__)
+
+# Inisialisasi Application builder untuk python-telegram-bot.
+# Pool koneksi bawaan hanya berisi 1 koneksi, sehingga semua panggilan Bot API
+# (sendMessage, editMessageText) antre di satu socket; perbesar agar koneksi
+# TLS ke Telegram dipakai ulang oleh pembaruan yang berjalan bersamaan.
+# HTTP/2 memultipleks panggilan tersebut dalam satu koneksi TLS ke api.telegram.org.
+application = (
+    Application.builder()
+    .token(TELEGRAM_BOT_TOKEN)
+    .http_version("2")
+    .connection_pool_size(16)
+    .pool_timeout(5.0)
+    .connect_timeout(5.0)
+    .read_timeout(10.0)
+    .build()
+)
 
-# Flag untuk menandai apakah aplikasi sudah diinisialisasi
-is_initialized = False
+# Klien HTTP bersama untuk API LLaMA, dibuat saat server mulai
+llama_client = None
 
 # Fungsi handler untuk perintah /start
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -50,58 +72,124 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+# Fungsi untuk memperbarui pesan hanya jika teksnya berubah
+async def edit_text_if_changed(context, chat_id, message_id, text, last_text):
+    if not text or text == last_text:
+        return last_text
+    await context.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text)
+    return text
+
+
+# Fungsi untuk mengganti pesan "memproses" dengan jawaban akhir atau pesan kesalahan
+async def replace_placeholder(context, chat_id, ack_task, text, last_text):
+    try:
+        processing_message = await ack_task
+    except Exception as e:
+        # Pesan "memproses" gagal terkirim; kirim teks sebagai pesan baru
+        logger.error(f"Failed to send processing message: {e}")
+        await context.bot.send_message(chat_id=chat_id, text=text)
+        return
+    await edit_text_if_changed(
+        context, chat_id, processing_message.message_id, text, last_text
+    )
+
+
 # Fungsi handler untuk pesan teks
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_prompt = update.message.text
     chat_id = update.message.chat_id
 
-    processing_message = await context.bot.send_message(
-        chat_id=chat_id, text="Sedang memproses permintaan Anda... Tunggu sebentar."
+    # Kirim pesan "memproses" bersamaan dengan permintaan ke API LLaMA
+    ack_task = asyncio.create_task(
+        context.bot.send_message(
+            chat_id=chat_id, text="Sedang memproses permintaan Anda... Tunggu sebentar."
+        )
     )
+    last_text = None
 
     try:
         api_data = {
-            "prompt": user_prompt,
+            "prompt": build_prompt(user_prompt),
             "max_tokens": 512,
             "temperature": 0.8,
+            "stream": True,
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(LLAMA_API_URL, json=api_data, timeout=300)
-
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success"):
-                generated_text = result.get("text", "Tidak dapat menghasilkan teks.")
-                await context.bot.send_message(chat_id=chat_id, text=generated_text)
+        generated_text = ""
+        final_text = None
+        chunks_since_edit = 0
+        last_edit = time.monotonic()
+        edit_blocked_until = 0.0
+
+        async with llama_client.stream(
+            "POST", LLAMA_API_URL, json=api_data, timeout=300
+        ) as response:
+            if response.status_code != 200:
+                final_text = f"API LLaMA tidak dapat dijangkau. Kode status: {response.status_code}"
             else:
-                error_message = result.get(
-                    "error", "Terjadi kesalahan yang tidak diketahui."
-                )
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"API LLaMA mengembalikan kesalahan: {error_message}",
-                )
-        else:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"API LLaMA tidak dapat dijangkau. Kode status: {response.status_code}",
-            )
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+
+                    event = orjson.loads(line[len("data: "):])
+                    if "error" in event:
+                        final_text = f"API LLaMA mengembalikan kesalahan: {event['error']}"
+                        break
+                    if event.get("stop"):
+                        break
+
+                    generated_text += event.get("content", "")
+                    chunks_since_edit += 1
+
+                    # Perbarui pesan secara berkala agar tidak terkena batas laju Telegram
+                    if time.monotonic() >= edit_blocked_until and (
+                        chunks_since_edit >= STREAM_EDIT_EVERY_CHUNKS
+                        or time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL
+                    ):
+                        # Pembaruan sementara boleh gagal; jawaban akhir tetap dikirim
+                        try:
+                            processing_message = await ack_task
+                            last_text = await edit_text_if_changed(
+                                context,
+                                chat_id,
+                                processing_message.message_id,
+                                generated_text.strip(),
+                                last_text,
+                            )
+                        except RetryAfter as e:
+                            logger.warning(f"Flood control on progress edit, waiting {e.retry_after}s")
+                            edit_blocked_until = time.monotonic() + e.retry_after
+                        except TelegramError as e:
+                            logger.warning(f"Failed to update progress message: {e}")
+                        chunks_since_edit = 0
+                        last_edit = time.monotonic()
+
+        if final_text is None:
+            final_text = generated_text.strip() or "Tidak dapat menghasilkan teks."
+
+        # Tunggu hingga batas flood control Telegram berakhir sebelum edit terakhir
+        delay = edit_blocked_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await replace_placeholder(context, chat_id, ack_task, final_text, last_text)
 
     except httpx.HTTPError as http_err:
         logger.error(f"HTTP Error: {http_err}")
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="Terjadi kesalahan saat mencoba terhubung ke API LLaMA. Pastikan API Anda berjalan.",
+        await replace_placeholder(
+            context,
+            chat_id,
+            ack_task,
+            "Terjadi kesalahan saat mencoba terhubung ke API LLaMA. Pastikan API Anda berjalan.",
+            last_text,
         )
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
-        await context.bot.send_message(
-            chat_id=chat_id, text="Terjadi kesalahan internal. Silakan coba lagi nanti."
-        )
-    finally:
-        await context.bot.delete_message(
-            chat_id=chat_id, message_id=processing_message.message_id
+        await replace_placeholder(
+            context,
+            chat_id,
+            ack_task,
+            "Terjadi kesalahan internal. Silakan coba lagi nanti.",
+            last_text,
         )
 
 # Tambahkan handler bot
@@ -112,14 +200,27 @@ application.add_handler(
 )
 
 
+@app.before_serving
+async def startup():
+    global llama_client
+    # Satu klien bersama agar koneksi ke API LLaMA dipakai ulang antar pesan
+    llama_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=100, max_keepalive_connections=20, keepalive_expiry=60
+        )
+    )
+    await application.initialize()
+
+
+@app.after_serving
+async def shutdown():
+    await application.shutdown()
+    await llama_client.aclose()
+
+
 @app.route(WEBHOOK_URL_PATH, methods=["POST"])
 async def telegram_webhook():
-    global is_initialized
-    if not is_initialized:
-        await application.initialize()
-        is_initialized = True
-
-    update = Update.de_json(request.get_json(force=True), application.bot)
+    update = Update.de_json(orjson.loads(await request.get_data()), application.bot)
     await application.process_update(update)
     return jsonify({"status": "success"})
 